@@ -0,0 +1,202 @@
+import math
+import operator
+from array import array
+
+from app.error import NativeError
+from app.function import Callable
+from . import utils, environment, governor
+
+# elements, a hard cap on any one array whatever the governor allows
+MAX_ARRAY_SIZE = 1 << 24
+ITEM_SIZE = array('d').itemsize
+
+
+class LoxArray:
+    def __init__(self, items=()):
+        self.items = array('d', items)
+
+    def grow(self, n):
+        pass
+
+    def __reduce__(self):
+        # restored through array_class so that the loading run's governor
+        # counts arrays loaded from a snapshot
+        return restore_array, (self.items,)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __str__(self):
+        return '[' + ', '.join(utils.to_str(x, True) for x in self.items) + ']'
+
+
+class CountedLoxArray(LoxArray):
+    # used instead of LoxArray while the governor caps array memory
+    def __init__(self, items=()):
+        self.governor = governor.current
+        self.nbytes = 0
+        super().__init__(items)
+        self.grow(len(self.items))
+
+    def grow(self, n):
+        self.governor.allocate_array(n * ITEM_SIZE)
+        self.nbytes += n * ITEM_SIZE
+
+    def __del__(self):
+        self.governor.array_bytes -= self.nbytes
+
+
+array_class = LoxArray
+
+
+def restore_array(items):
+    return array_class(items)
+
+
+# ops accepted by the `map` native, applied to every element in one call
+MAP_OPS = {
+    'abs': abs,
+    'neg': operator.neg,
+    'sqrt': math.sqrt,
+    'exp': math.exp,
+    'log': math.log,
+    'sin': math.sin,
+    'cos': math.cos,
+    'floor': lambda x: float(math.floor(x)),
+    'ceil': lambda x: float(math.ceil(x)),
+}
+
+
+def check_array(value):
+    if not isinstance(value, LoxArray):
+        raise NativeError("Argument must be an array.")
+    return value.items
+
+def check_number(value):
+    if not isinstance(value, float):
+        raise NativeError("Argument must be a number.")
+    return value
+
+def check_index(value, n, upper=False):
+    if not isinstance(value, float) or not value.is_integer():
+        raise NativeError("Array index must be an integer.")
+    i = int(value)
+    if i < 0 or i > n or (i == n and not upper):
+        raise NativeError("Array index out of bounds.")
+    return i
+
+
+class Array(Callable):
+    def call(self, argumnets):
+        n = check_number(argumnets[0])
+        if n < 0 or not n.is_integer():
+            raise NativeError("Array size must be a non-negative integer.")
+        if n > MAX_ARRAY_SIZE:
+            raise NativeError("Array size too large.")
+        return array_class(bytes(ITEM_SIZE * int(n)))
+
+    def arity(self):
+        return 1
+
+
+class Length(Callable):
+    def call(self, argumnets):
+        return float(len(check_array(argumnets[0])))
+
+    def arity(self):
+        return 1
+
+
+class Get(Callable):
+    def call(self, argumnets):
+        items = check_array(argumnets[0])
+        return items[check_index(argumnets[1], len(items))]
+
+    def arity(self):
+        return 2
+
+
+class Set(Callable):
+    def call(self, argumnets):
+        items = check_array(argumnets[0])
+        value = check_number(argumnets[2])
+        items[check_index(argumnets[1], len(items))] = value
+        return value
+
+    def arity(self):
+        return 3
+
+
+class Push(Callable):
+    def call(self, argumnets):
+        items = check_array(argumnets[0])
+        value = check_number(argumnets[1])
+        if len(items) >= MAX_ARRAY_SIZE:
+            raise NativeError("Array size too large.")
+        argumnets[0].grow(1)
+        items.append(value)
+        return argumnets[0]
+
+    def arity(self):
+        return 2
+
+
+class Slice(Callable):
+    def call(self, argumnets):
+        items = check_array(argumnets[0])
+        n = len(items)
+        start = check_index(argumnets[1], n, upper=True)
+        end = check_index(argumnets[2], n, upper=True)
+        return array_class(items[start:max(start, end)])
+
+    def arity(self):
+        return 3
+
+
+class Sum(Callable):
+    def call(self, argumnets):
+        return float(sum(check_array(argumnets[0])))
+
+    def arity(self):
+        return 1
+
+
+class Dot(Callable):
+    def call(self, argumnets):
+        left = check_array(argumnets[0])
+        right = check_array(argumnets[1])
+        if len(left) != len(right):
+            raise NativeError("Arrays must have the same length.")
+        return float(sum(map(operator.mul, left, right)))
+
+    def arity(self):
+        return 2
+
+
+class Map(Callable):
+    def call(self, argumnets):
+        items = check_array(argumnets[0])
+        if (op := MAP_OPS.get(argumnets[1])) is None:
+            raise NativeError(f"Unknown array op '{utils.to_str(argumnets[1])}'.")
+        try:
+            return array_class(map(op, items))
+        except (ValueError, OverflowError):
+            raise NativeError(f"Array op '{argumnets[1]}' out of domain.")
+
+    def arity(self):
+        return 2
+
+
+NATIVES = {
+    'array': Array(),
+    'len': Length(),
+    'get': Get(),
+    'set': Set(),
+    'push': Push(),
+    'slice': Slice(),
+    'sum': Sum(),
+    'dot': Dot(),
+    'map': Map(),
+}
+
+environment.register_natives(NATIVES)
@@ -0,0 +1,71 @@
+from app.function import Callable
+
+
+class Shape:
+    # Hidden class shared by every instance of a class that got the same
+    # fields in the same order. Field values live in the instance's `values`
+    # list at the index recorded here, so property sites can cache the shape
+    # and index instead of hashing field names on every access.
+    def __init__(self, klass, fields=None):
+        self.klass = klass
+        self.fields = fields or {}
+        self.transitions = {}
+
+    def add(self, name):
+        if (shape := self.transitions.get(name)) is None:
+            fields = dict(self.fields)
+            fields[name] = len(fields)
+            shape = self.transitions[name] = Shape(self.klass, fields)
+        return shape
+
+
+class LoxClass(Callable):
+    def __init__(self, name, superclass, methods):
+        self.name = name
+        self.superclass = superclass
+        # inherited methods are copied in, so lookups never walk the chain
+        self.methods = dict(superclass.methods) if superclass else {}
+        self.methods.update(methods)
+        self.shape = Shape(self)
+
+    def call(self, argumnets):
+        instance = LoxInstance(self.shape)
+        if (initializer := self.methods.get('init')) is not None:
+            initializer.call([*argumnets, instance])
+        return instance
+
+    def arity(self):
+        if (initializer := self.methods.get('init')) is not None:
+            return initializer.arity()
+        return 0
+
+    def __str__(self):
+        return self.name
+
+
+class LoxInstance:
+    __slots__ = ('shape', 'values')
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.values = []
+
+    def __str__(self):
+        return f"{self.shape.klass.name} instance"
+
+
+class BoundMethod(Callable):
+    def __init__(self, method, receiver):
+        self.method = method
+        self.receiver = receiver
+
+    def call(self, argumnets):
+        # the receiver is passed as the last argument and lands in `this`
+        result = self.method.call([*argumnets, self.receiver])
+        return self.receiver if self.method.is_initializer else result
+
+    def arity(self):
+        return self.method.arity()
+
+    def __str__(self):
+        return str(self.method)
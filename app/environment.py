@@ -1,20 +1,23 @@
-from contextlib import contextmanager
-from app.function import Clock
 from .error import EvaluationError
+from . import governor
+
+class Cell:
+    # a variable captured by a closure, shared between the declaring frame
+    # and every closure that references it
+    __slots__ = ('value',)
+
+    def __init__(self, value=None):
+        self.value = value
+
 
 class Environment:
-    def __init__(self, enclosing=None):
-        self.enclosing = enclosing
+    # the global variables; locals live in frames and never chain here
+    def __init__(self):
         self.values = {}
 
-    def __str__(self):
-        return str(self.values) + ' <- ' + str(self.enclosing)
-
     def get(self, name):
         if name.lexeme in self.values:
             return self.values[name.lexeme]
-        if self.enclosing:
-            return self.enclosing.get(name)
 
         raise EvaluationError(name.line, f"Undefined variable '{name.lexeme}'.")
 
@@ -25,14 +28,42 @@ class Environment:
         if name.lexeme in self.values:
             self.values[name.lexeme] = value
             return value
-        if self.enclosing:
-            return self.enclosing.update(name, value)
 
         raise EvaluationError(name.line, f"Undefined variable '{name.lexeme}'.")
 
 
+class CountedFrame(list):
+    # used instead of a plain list while the governor caps live frames;
+    # `governor` is only set once the frame has been counted
+    governor = None
+
+    def __init__(self, values):
+        governor.current.allocate_environment()
+        self.governor = governor.current
+        super().__init__(values)
+
+    def __del__(self):
+        if self.governor is not None:
+            self.governor.environments -= 1
+
+
+frame_class = list
+
+# Globals stay in a dict so they can be declared after the functions that
+# use them. Locals are resolved to slots of `frame`, the list of values
+# belonging to the running function call or top-level statement.
 env = Environment()
-env.set('clock', Clock())
+
+frame = []
+
+# Modules defining natives register them when they are imported, so that
+# this module doesn't need to import them.
+NATIVES = {}
+
+
+def register_natives(natives):
+    NATIVES.update(natives)
+    env.values.update(natives)
 
 
 def get_env(name):
@@ -44,13 +75,3 @@ def set_env(name, value):
 def update_env(name, value):
     return env.update(name, value)
 
-
-@contextmanager
-def enclosing(e=None):
-    global env
-    previous_env = env
-    env = Environment(e or env)
-    try:
-        yield
-    finally:
-        env = previous_env
@@ -1,6 +1,8 @@
 import sys
 from contextlib import contextmanager
 
+from . import output
+
 error_code = 0
 
 class ParseError(Exception):
@@ -15,6 +17,22 @@ class EvaluationError(Exception):
         self.msg = msg
 
 
+class NativeError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+class ResourceLimitError(Exception):
+    def __init__(self, msg, line_no=None):
+        self.msg = msg
+        self.line_no = line_no
+
+
+class SnapshotError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
 class Return(Exception):
     def __init__(self, value):
         self.value = value
@@ -27,7 +45,18 @@ def handled_error():
         yield
     except ParseError as e:
         error_code = 65
+        output.flush()
         sys.stderr.write(f'[line {e.line_no}] Error{e.where}: {e.msg}\n')
     except EvaluationError as e:
         error_code = 70
+        output.flush()
         sys.stderr.write(f'{e.msg}\n[line {e.line_no}]\n')
+    except ResourceLimitError as e:
+        error_code = 75
+        output.flush()
+        where = '' if e.line_no is None else f'[line {e.line_no}]\n'
+        sys.stderr.write(f'{e.msg}\n{where}')
+    except SnapshotError as e:
+        error_code = 74
+        output.flush()
+        sys.stderr.write(f'{e.msg}\n')
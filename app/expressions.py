@@ -1,15 +1,23 @@
-from dataclasses import dataclass
-from typing import Any
-
 from app.function import Callable
-from . import utils, tokenizer, error, environment
+from . import utils, tokenizer, error, environment, strings, resolver
+from .classes import BoundMethod, LoxInstance
 
+# Nodes are plain classes with a hand-written __init__ rather than
+# dataclasses, which generate their methods with exec() at import time.
 class Expr:
-    def evaluate(self) -> Any: ...
+    fields = ()
+
+    def evaluate(self) -> object: ...
+    def resolve(self, scope) -> None: ...
+
+    def __repr__(self):
+        return utils.node_repr(self)
 
-@dataclass
 class Literal(Expr):
-    value: Any = None
+    fields = ('value',)
+
+    def __init__(self, value: object = None):
+        self.value = value
 
     def evaluate(self):
         return self.value
@@ -17,11 +25,13 @@ class Literal(Expr):
     def __str__(self):
         return utils.to_str(self.value)
 
-@dataclass
 class Logical(Expr):
-    left: Expr
-    operator: tokenizer.Token
-    right: Expr
+    fields = ('left', 'operator', 'right')
+
+    def __init__(self, left: Expr, operator: tokenizer.Token, right: Expr):
+        self.left = left
+        self.operator = operator
+        self.right = right
 
     def evaluate(self):
         left = self.left.evaluate()
@@ -34,10 +44,16 @@ class Logical(Expr):
                 return left
         return self.right.evaluate()
 
-@dataclass
+    def resolve(self, scope):
+        self.left.resolve(scope)
+        self.right.resolve(scope)
+
 class Unary(Expr):
-    operator: tokenizer.Token
-    right: Expr
+    fields = ('operator', 'right')
+
+    def __init__(self, operator: tokenizer.Token, right: Expr):
+        self.operator = operator
+        self.right = right
 
     def evaluate(self):
         right = self.right.evaluate()
@@ -49,19 +65,50 @@ class Unary(Expr):
                     raise error.EvaluationError(self.operator.line, "Operand must be a number.")
                 return -right
 
+    def resolve(self, scope):
+        self.right.resolve(scope)
+
     def __str__(self):
         return utils.parenthesize(self.operator.lexeme, str(self.right))
 
 
-@dataclass
 class Binary(Expr):
-    left: Expr
-    operator: tokenizer.Token
-    right: Expr
+    fields = ('left', 'operator', 'right')
+
+    def __init__(self, left: Expr, operator: tokenizer.Token, right: Expr):
+        self.left = left
+        self.operator = operator
+        self.right = right
+
+    # number of times a specialized variant of this node fell back
+    deopts = 0
 
     def evaluate(self):
         left = self.left.evaluate()
         right = self.right.evaluate()
+        if self.deopts < MAX_DEOPTS:
+            self.specialize(left, right)
+        return self.operate(left, right)
+
+    def specialize(self, left, right):
+        op = self.operator.type
+        if type(left) is float and type(right) is float:
+            specialized = FLOAT_SPECIALIZATIONS.get(op)
+        elif op == tokenizer.TokenType.PLUS and strings.is_string(left) and strings.is_string(right):
+            specialized = StringConcat
+        else:
+            specialized = None
+        if specialized is None:
+            specialized = EQUALITY_SPECIALIZATIONS.get(op)
+        if specialized is not None:
+            self.__class__ = specialized
+
+    def deoptimize(self, left, right):
+        self.__class__ = Binary
+        self.deopts += 1
+        return self.operate(left, right)
+
+    def operate(self, left, right):
         match self.operator.type:
             case tokenizer.TokenType.MINUS:
                 if not utils.are_number_operands(left, right):
@@ -70,7 +117,9 @@ class Binary(Expr):
             case tokenizer.TokenType.PLUS:
                 if not utils.either_numbers_or_strings_operands(left, right):
                     raise error.EvaluationError(self.operator.line, "Operands must be two numbers or two strings.")
-                return left + right
+                if isinstance(left, float):
+                    return left + right
+                return strings.concat(left, right)
             case tokenizer.TokenType.SLASH:
                 if not utils.are_number_operands(left, right):
                     raise error.EvaluationError(self.operator.line, "Operands must be number.")
@@ -100,47 +149,361 @@ class Binary(Expr):
             case tokenizer.TokenType.EQUAL_EQUAL:
                 return left == right
 
+    def resolve(self, scope):
+        self.left.resolve(scope)
+        self.right.resolve(scope)
+
     def __str__(self):
         return utils.parenthesize(self.operator.lexeme, str(self.left), str(self.right))
 
-@dataclass
+
+# Binary nodes rewrite their class into one of the variants below once they
+# have seen operands of a matching type. Each variant guards on the operand
+# types and falls back to the generic Binary when the guard fails; a node that
+# keeps failing its guards stays generic after MAX_DEOPTS fallbacks.
+MAX_DEOPTS = 4
+
+class FloatAdd(Binary):
+    def evaluate(self):
+        left = self.left.evaluate()
+        right = self.right.evaluate()
+        if type(left) is float and type(right) is float:
+            return left + right
+        return self.deoptimize(left, right)
+
+class FloatSubtract(Binary):
+    def evaluate(self):
+        left = self.left.evaluate()
+        right = self.right.evaluate()
+        if type(left) is float and type(right) is float:
+            return left - right
+        return self.deoptimize(left, right)
+
+class FloatMultiply(Binary):
+    def evaluate(self):
+        left = self.left.evaluate()
+        right = self.right.evaluate()
+        if type(left) is float and type(right) is float:
+            return left * right
+        return self.deoptimize(left, right)
+
+class FloatDivide(Binary):
+    def evaluate(self):
+        left = self.left.evaluate()
+        right = self.right.evaluate()
+        if type(left) is float and type(right) is float:
+            return left / right
+        return self.deoptimize(left, right)
+
+class FloatGreater(Binary):
+    def evaluate(self):
+        left = self.left.evaluate()
+        right = self.right.evaluate()
+        if type(left) is float and type(right) is float:
+            return left > right
+        return self.deoptimize(left, right)
+
+class FloatGreaterEqual(Binary):
+    def evaluate(self):
+        left = self.left.evaluate()
+        right = self.right.evaluate()
+        if type(left) is float and type(right) is float:
+            return left >= right
+        return self.deoptimize(left, right)
+
+class FloatLess(Binary):
+    def evaluate(self):
+        left = self.left.evaluate()
+        right = self.right.evaluate()
+        if type(left) is float and type(right) is float:
+            return left < right
+        return self.deoptimize(left, right)
+
+class FloatLessEqual(Binary):
+    def evaluate(self):
+        left = self.left.evaluate()
+        right = self.right.evaluate()
+        if type(left) is float and type(right) is float:
+            return left <= right
+        return self.deoptimize(left, right)
+
+class StringConcat(Binary):
+    def evaluate(self):
+        left = self.left.evaluate()
+        right = self.right.evaluate()
+        if strings.is_string(left) and strings.is_string(right):
+            return strings.concat(left, right)
+        return self.deoptimize(left, right)
+
+# equality is defined for every pair of values, so these need no guard
+class Equal(Binary):
+    def evaluate(self):
+        return self.left.evaluate() == self.right.evaluate()
+
+class NotEqual(Binary):
+    def evaluate(self):
+        return self.left.evaluate() != self.right.evaluate()
+
+
+FLOAT_SPECIALIZATIONS = {
+    tokenizer.TokenType.PLUS: FloatAdd,
+    tokenizer.TokenType.MINUS: FloatSubtract,
+    tokenizer.TokenType.STAR: FloatMultiply,
+    tokenizer.TokenType.SLASH: FloatDivide,
+    tokenizer.TokenType.GREATER: FloatGreater,
+    tokenizer.TokenType.GREATER_EQUAL: FloatGreaterEqual,
+    tokenizer.TokenType.LESS: FloatLess,
+    tokenizer.TokenType.LESS_EQUAL: FloatLessEqual,
+}
+
+EQUALITY_SPECIALIZATIONS = {
+    tokenizer.TokenType.EQUAL_EQUAL: Equal,
+    tokenizer.TokenType.BANG_EQUAL: NotEqual,
+}
+
 class Grouping(Expr):
-    expression: Expr
+    fields = ('expression',)
+
+    def __init__(self, expression: Expr):
+        self.expression = expression
 
     def evaluate(self):
         return self.expression.evaluate()
 
+    def resolve(self, scope):
+        self.expression.resolve(scope)
+
     def __str__(self):
         return utils.parenthesize('group', str(self.expression))
 
-@dataclass
 class Variable(Expr):
-    name: tokenizer.Token
+    fields = ('name',)
+
+    def __init__(self, name: tokenizer.Token):
+        self.name = name
 
+    # unresolved variables are globals
     def evaluate(self):
         return environment.get_env(self.name)
 
+    def resolve(self, scope):
+        scope.reference(self)
+
+    def bind(self, slot):
+        self.slot = slot.index
+        self.__class__ = CellVariable if slot.captured else LocalVariable
+
+class LocalVariable(Variable):
+    def evaluate(self):
+        return environment.frame[self.slot]
+
+class CellVariable(Variable):
+    def evaluate(self):
+        return environment.frame[self.slot].value
+
 
-@dataclass
 class Assignment(Expr):
-    name: tokenizer.Token
-    value: Expr
+    fields = ('name', 'value')
+
+    def __init__(self, name: tokenizer.Token, value: Expr):
+        self.name = name
+        self.value = value
 
     def evaluate(self):
         return environment.update_env(self.name, self.value.evaluate())
 
-@dataclass
-class Call(Expr):
-    callee: Expr
-    paren: tokenizer.Token
-    arguments: list[Expr]
+    def resolve(self, scope):
+        self.value.resolve(scope)
+        scope.reference(self)
+
+    def bind(self, slot):
+        self.slot = slot.index
+        self.__class__ = CellAssignment if slot.captured else LocalAssignment
+
+class LocalAssignment(Assignment):
+    def evaluate(self):
+        value = environment.frame[self.slot] = self.value.evaluate()
+        return value
 
+class CellAssignment(Assignment):
     def evaluate(self):
-        callee = self.callee.evaluate()
+        value = environment.frame[self.slot].value = self.value.evaluate()
+        return value
+
+# stands for a callee that Call.evaluate still has to evaluate itself
+UNEVALUATED = object()
+
+class Call(Expr):
+    fields = ('callee', 'paren', 'arguments')
+
+    def __init__(self, callee: Expr, paren: tokenizer.Token, arguments: list[Expr]):
+        self.callee = callee
+        self.paren = paren
+        self.arguments = arguments
+
+    # Invoke's slow path passes in the callee it already looked up; plain
+    # calls take no extra Python frame either way
+    def evaluate(self, callee=UNEVALUATED):
+        if callee is UNEVALUATED:
+            callee = self.callee.evaluate()
         if not isinstance(callee, Callable):
             raise error.EvaluationError(self.paren.line, "Can only call functions and classes.")
-        arity = callee.arity()
-        nargs = len(self.arguments)
-        if arity != nargs:
-            raise error.EvaluationError(self.paren.line, f"Expected {arity} arguments but got {nargs}.")
-        return callee.call([arg.evaluate() for arg in self.arguments])
+        if callee.arity() != len(self.arguments):
+            raise self.arity_error(callee.arity())
+        arguments = [arg.evaluate() for arg in self.arguments]
+        try:
+            return callee.call(arguments)
+        except error.NativeError as e:
+            raise error.EvaluationError(self.paren.line, e.msg)
+        except error.ResourceLimitError as e:
+            raise self.limit_error(e)
+
+    def arity_error(self, arity):
+        return error.EvaluationError(
+            self.paren.line, f"Expected {arity} arguments but got {len(self.arguments)}."
+        )
+
+    def limit_error(self, e):
+        # limits hit inside the callee are reported at the call
+        if e.line_no is None:
+            e.line_no = self.paren.line
+        return e
+
+    def resolve(self, scope):
+        self.callee.resolve(scope)
+        for arg in self.arguments:
+            arg.resolve(scope)
+
+class Invoke(Call):
+    # `object.name(...)`: calling a method found through the get site's
+    # cache does not allocate a bound method
+    def evaluate(self):
+        get = self.callee
+        instance = get.object.evaluate()
+        if (type(instance) is not LoxInstance or instance.shape is not get.cached_shape
+                or get.cached_method is None):
+            return Call.evaluate(self, get.lookup(instance))
+
+        method = get.cached_method
+        if method.arity() != len(self.arguments):
+            raise self.arity_error(method.arity())
+        arguments = [arg.evaluate() for arg in self.arguments]
+        arguments.append(instance)
+        try:
+            result = method.call(arguments)
+        except error.ResourceLimitError as e:
+            raise self.limit_error(e)
+        return instance if method.is_initializer else result
+
+
+# Property sites keep a monomorphic inline cache keyed on the instance shape.
+# A shape belongs to a single class, so a cached method stays valid as long
+# as the shape matches.
+class Get(Expr):
+    fields = ('object', 'name')
+
+    def __init__(self, object: Expr, name: tokenizer.Token):
+        self.object = object
+        self.name = name
+
+    cached_shape = None
+    cached_index = None
+    cached_method = None
+
+    def evaluate(self):
+        instance = self.object.evaluate()
+        if type(instance) is LoxInstance and instance.shape is self.cached_shape:
+            if self.cached_method is None:
+                return instance.values[self.cached_index]
+            return BoundMethod(self.cached_method, instance)
+        return self.lookup(instance)
+
+    def lookup(self, instance):
+        if not isinstance(instance, LoxInstance):
+            raise error.EvaluationError(self.name.line, "Only instances have properties.")
+        shape = instance.shape
+        name = self.name.lexeme
+        if (index := shape.fields.get(name)) is not None:
+            self.cached_shape, self.cached_index, self.cached_method = shape, index, None
+            return instance.values[index]
+        if (method := shape.klass.methods.get(name)) is not None:
+            self.cached_shape, self.cached_index, self.cached_method = shape, None, method
+            return BoundMethod(method, instance)
+        raise error.EvaluationError(self.name.line, f"Undefined property '{name}'.")
+
+    def resolve(self, scope):
+        self.object.resolve(scope)
+
+
+class Set(Expr):
+    fields = ('object', 'name', 'value')
+
+    def __init__(self, object: Expr, name: tokenizer.Token, value: Expr):
+        self.object = object
+        self.name = name
+        self.value = value
+
+    # for a new field, cached_next is the shape after adding it
+    cached_shape = None
+    cached_index = None
+    cached_next = None
+
+    def evaluate(self):
+        instance = self.object.evaluate()
+        if not isinstance(instance, LoxInstance):
+            raise error.EvaluationError(self.name.line, "Only instances have fields.")
+        value = self.value.evaluate()
+        shape = instance.shape
+        if shape is not self.cached_shape:
+            self.cache(shape)
+        if self.cached_next is None:
+            instance.values[self.cached_index] = value
+        else:
+            instance.values.append(value)
+            instance.shape = self.cached_next
+        return value
+
+    def cache(self, shape):
+        self.cached_shape = shape
+        if (index := shape.fields.get(self.name.lexeme)) is not None:
+            self.cached_index, self.cached_next = index, None
+        else:
+            self.cached_index, self.cached_next = None, shape.add(self.name.lexeme)
+
+    def resolve(self, scope):
+        self.object.resolve(scope)
+        self.value.resolve(scope)
+
+
+class This(Variable):
+    def resolve(self, scope):
+        if scope.class_kind is None:
+            raise resolver.error(self.name, "Can't use 'this' outside of a class.")
+        scope.reference(self)
+
+
+class Super(Expr):
+    fields = ('keyword', 'method')
+
+    def __init__(self, keyword: tokenizer.Token, method: tokenizer.Token):
+        self.keyword = keyword
+        self.method = method
+
+    def evaluate(self):
+        superclass = self.superclass.evaluate()
+        instance = self.instance.evaluate()
+        if (method := superclass.methods.get(self.method.lexeme)) is None:
+            raise error.EvaluationError(self.method.line, f"Undefined property '{self.method.lexeme}'.")
+        return BoundMethod(method, instance)
+
+    def resolve(self, scope):
+        if scope.class_kind is None:
+            raise resolver.error(self.keyword, "Can't use 'super' outside of a class.")
+        if scope.class_kind != 'subclass':
+            raise resolver.error(self.keyword, "Can't use 'super' in a class with no superclass.")
+        # both are plain variables declared by the resolver around methods
+        self.superclass = Variable(self.keyword)
+        self.instance = Variable(tokenizer.Token(tokenizer.TokenType.THIS, 'this', None, self.keyword.line))
+        self.superclass.resolve(scope)
+        self.instance.resolve(scope)
+
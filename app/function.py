@@ -1,12 +1,11 @@
 import time
-from typing import Any
 
 from app.error import Return
 
-from . import environment
+from . import environment, governor
 
 class Callable:
-    def call(self, argumnets) -> Any: ...
+    def call(self, argumnets) -> object: ...
     def arity(self) -> int: ...
     def __str__(self) -> str: return '<native fn>'
 
@@ -19,22 +18,68 @@ class Clock(Callable):
         return 0
 
 class LoxFunction(Callable):
-    def __init__(self, declaration, closure):
+    def __init__(self, declaration, closure, is_initializer=False):
         self.declaration = declaration
+        # only the cells of the enclosing frames this function refers to
         self.closure = closure
+        self.is_initializer = is_initializer
 
     def call(self, argumnets):
-        with environment.enclosing(self.closure):
-            for i, param in enumerate(self.declaration.params):
-                environment.set_env(param.lexeme, argumnets[i])
+        gov = governor.current
+        gov.ticks -= 1
+        if gov.ticks < 0:
+            gov.checkpoint()
+        gov.enter_call()
 
-            try:
-                self.declaration.body.evaluate()
-            except Return as e:
-                return e.value
+        declaration = self.declaration
+        previous = environment.frame
+        try:
+            frame = environment.frame_class(declaration.frame_template)
+            frame[:len(argumnets)] = argumnets
+            for i in declaration.captured_params:
+                frame[i] = environment.Cell(frame[i])
+            for i, cell in zip(declaration.free_slots, self.closure):
+                frame[i] = cell
+
+            environment.frame = frame
+            declaration.body.evaluate()
+        except Return as e:
+            return e.value
+        finally:
+            environment.frame = previous
+            gov.depth -= 1
 
     def arity(self):
         return len(self.declaration.params)
 
+    def __reduce__(self):
+        # restored through closure_class so the governor and memstats
+        # count closures loaded from a snapshot like any other
+        return restore_closure, (self.declaration, self.closure, self.is_initializer)
+
     def __str__(self):
         return f"<fn {self.declaration.name.lexeme}>"
+
+
+class CountedLoxFunction(LoxFunction):
+    # used instead of LoxFunction while the governor caps live closures;
+    # `governor` is only set once the closure has been counted
+    governor = None
+
+    def __init__(self, declaration, closure, is_initializer=False):
+        governor.current.allocate_closure(declaration.name.line)
+        self.governor = governor.current
+        super().__init__(declaration, closure, is_initializer)
+
+    def __del__(self):
+        if self.governor is not None:
+            self.governor.closures -= 1
+
+
+closure_class = LoxFunction
+
+environment.register_natives({'clock': Clock()})
+
+
+def restore_closure(declaration, closure, is_initializer):
+    return closure_class(declaration, closure, is_initializer)
@@ -0,0 +1,129 @@
+import gc
+import math
+import time
+
+from .error import ResourceLimitError
+
+# Loops and calls only decrement `ticks`; the limits are looked at once the
+# ticks run out, at most every CHECK_INTERVAL steps.
+CHECK_INTERVAL = 1024
+
+
+class Limits:
+    def __init__(
+        self,
+        max_steps: int | None = None,
+        timeout: float | None = None,
+        max_environments: int | None = None,
+        max_closures: int | None = None,
+        max_call_depth: int | None = None,
+        max_array_bytes: int | None = None,
+        max_tasks: int | None = None,
+    ):
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.max_environments = max_environments
+        self.max_closures = max_closures
+        self.max_call_depth = max_call_depth
+        self.max_array_bytes = max_array_bytes
+        self.max_tasks = max_tasks
+
+
+class Governor:
+    def __init__(self, limits=None):
+        self.limits = limits or Limits()
+        self.max_call_depth = self.limits.max_call_depth
+        if self.max_call_depth is None:
+            self.max_call_depth = math.inf
+        self.depth = 0
+        self.environments = 0
+        self.closures = 0
+        self.array_bytes = 0
+        self.deadline = None
+        self.remaining = 0
+        self.ticks = 0
+        self.start()
+
+    def start(self):
+        limits = self.limits
+        if limits.timeout is not None:
+            self.deadline = time.monotonic() + limits.timeout
+        self.remaining = math.inf if limits.max_steps is None else limits.max_steps
+        self.depth = 0
+        self.ticks = self.refill()
+
+    def refill(self):
+        ticks = min(CHECK_INTERVAL, self.remaining)
+        self.remaining -= ticks
+        return ticks
+
+    def checkpoint(self, line_no=None):
+        # called with ticks below zero, i.e. on the first step past the batch
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise ResourceLimitError('Execution time limit exceeded.', line_no)
+        if not self.remaining:
+            raise ResourceLimitError('Step limit exceeded.', line_no)
+        self.ticks = self.refill() - 1
+
+    def time_left(self):
+        # for natives that block: None without a deadline
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def enter_call(self):
+        self.depth += 1
+        if self.depth > self.max_call_depth:
+            self.depth -= 1
+            raise ResourceLimitError('Call depth limit exceeded.')
+
+    # environments and closures that captured them form reference cycles,
+    # so collect those before deciding that a cap has really been reached
+    def allocate_environment(self):
+        if self.environments >= self.limits.max_environments:
+            gc.collect()
+        if self.environments >= self.limits.max_environments:
+            raise ResourceLimitError('Environment limit exceeded.')
+        self.environments += 1
+
+    def allocate_closure(self, line_no=None):
+        if self.closures >= self.limits.max_closures:
+            gc.collect()
+        if self.closures >= self.limits.max_closures:
+            raise ResourceLimitError('Closure limit exceeded.', line_no)
+        self.closures += 1
+
+    def allocate_task(self, live):
+        if self.limits.max_tasks is not None and live >= self.limits.max_tasks:
+            raise ResourceLimitError('Task limit exceeded.')
+
+    def allocate_array(self, nbytes):
+        if self.array_bytes + nbytes > self.limits.max_array_bytes:
+            gc.collect()
+        if self.array_bytes + nbytes > self.limits.max_array_bytes:
+            raise ResourceLimitError('Array memory limit exceeded.')
+        self.array_bytes += nbytes
+
+
+current = Governor()
+
+
+def install(governor):
+    global current
+    # the classes swapped in live in modules that import this one
+    from . import arrays, environment, function
+    current = governor
+    limits = governor.limits
+    environment.frame_class = (
+        list if limits.max_environments is None
+        else environment.CountedFrame
+    )
+    function.closure_class = (
+        function.LoxFunction if limits.max_closures is None
+        else function.CountedLoxFunction
+    )
+    arrays.array_class = (
+        arrays.LoxArray if limits.max_array_bytes is None
+        else arrays.CountedLoxArray
+    )
+    governor.start()
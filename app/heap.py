@@ -0,0 +1,266 @@
+import gc
+import sys
+import weakref
+
+from . import environment, function, governor, memstats, strings
+from .classes import BoundMethod, LoxClass, LoxInstance
+from .expressions import Expr
+from .statements import Statement
+
+# Counting subclasses for frames and closures, swapped in by install() the
+# same way the governor swaps in its own when a cap is set. Sizes are
+# approximate: sys.getsizeof of the objects themselves, not of the values
+# they share with others.
+#
+# Python strings can't report when they die, so live strings are counted by
+# walking everything reachable from globals, live frames and live closures
+# whenever a report is made; concatenation results are counted as they are
+# allocated.
+
+
+class Stat:
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.peak_count = 0
+        self.peak_bytes = 0
+
+    def add(self, size):
+        self.count += 1
+        self.bytes += size
+        if self.count > self.peak_count:
+            self.peak_count = self.count
+        if self.bytes > self.peak_bytes:
+            self.peak_bytes = self.bytes
+
+    def remove(self, size):
+        self.count -= 1
+        self.bytes -= size
+
+    def sample(self, count, size):
+        self.peak_count = max(self.peak_count, count)
+        self.peak_bytes = max(self.peak_bytes, size)
+        self.count = count
+        self.bytes = size
+
+    def __str__(self):
+        return (
+            f"{self.count} live, {self.bytes} bytes"
+            f" (peak {self.peak_count}, {self.peak_bytes} bytes)"
+        )
+
+
+class Tracker:
+    def __init__(self):
+        self.frames = Stat()
+        self.closures = Stat()
+        self.strings = Stat()
+        self.allocated_strings = Stat()
+        # live frames by call depth, 0 being top-level code
+        self.depths = {}
+        self.max_depth = 0
+        # id -> weak reference, frames are lists and can't go in a WeakSet
+        self.live_frames = {}
+        self.live_closures = {}
+        self.trees = []
+
+    def install(self):
+        environment.frame_class = TRACKED_FRAMES.get(
+            environment.frame_class, environment.frame_class
+        )
+        function.closure_class = TRACKED_CLOSURES.get(
+            function.closure_class, function.closure_class
+        )
+        strings.concat = tracked_concat
+
+    def add_tree(self, stmt):
+        self.trees.append(stmt)
+
+    def add_frame(self, frame):
+        frame.depth = depth = governor.current.depth
+        frame.size = sys.getsizeof(frame)
+        self.frames.add(frame.size)
+        self.depths[depth] = self.depths.get(depth, 0) + 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+        self.live_frames[id(frame)] = weakref.ref(frame)
+
+    def remove_frame(self, frame):
+        # a frame the governor refused was never added
+        if getattr(frame, 'size', None) is None:
+            return
+        self.frames.remove(frame.size)
+        del self.live_frames[id(frame)]
+        self.depths[frame.depth] -= 1
+
+    def add_closure(self, closure):
+        closure.size = closure_size(closure)
+        self.closures.add(closure.size)
+        self.live_closures[id(closure)] = weakref.ref(closure)
+
+    def remove_closure(self, closure):
+        if getattr(closure, 'size', None) is None:
+            return
+        self.closures.remove(closure.size)
+        del self.live_closures[id(closure)]
+
+    def count_strings(self):
+        seen = set()
+        count = 0
+        size = 0
+        pending = list(environment.env.values.values())
+        for ref in list(self.live_frames.values()):
+            if (frame := ref()) is not None:
+                pending.extend(frame)
+        for ref in list(self.live_closures.values()):
+            if (closure := ref()) is not None:
+                pending.extend(closure.closure)
+        while pending:
+            value = pending.pop()
+            if id(value) in seen:
+                continue
+            seen.add(id(value))
+            if type(value) is str:
+                count += 1
+                size += sys.getsizeof(value)
+            elif type(value) is strings.Rope:
+                count += 1
+                size += rope_size(value)
+            elif type(value) is environment.Cell:
+                pending.append(value.value)
+            elif isinstance(value, LoxInstance):
+                pending.extend(value.values)
+            elif isinstance(value, BoundMethod):
+                pending.append(value.receiver)
+                pending.append(value.method)
+            elif isinstance(value, function.LoxFunction):
+                pending.extend(value.closure)
+            elif isinstance(value, LoxClass):
+                pending.extend(value.methods.values())
+        self.strings.sample(count, size)
+
+    def count_nodes(self):
+        nodes = {}
+        seen = set()
+        pending = list(self.trees)
+        while pending:
+            value = pending.pop()
+            if isinstance(value, (list, tuple)):
+                pending.extend(value)
+                continue
+            if not isinstance(value, (Expr, Statement)) or id(value) in seen:
+                continue
+            seen.add(id(value))
+            count, size = nodes.get(type(value).__name__, (0, 0))
+            nodes[type(value).__name__] = (count + 1, size + node_size(value))
+            pending.extend(getattr(value, name) for name in value.fields)
+        return nodes
+
+    def report(self):
+        # closures and frames in reference cycles would still be counted
+        gc.collect()
+        self.count_strings()
+        nodes = self.count_nodes()
+        lines = [f"frames: {self.frames}"]
+        lines.extend(
+            f"  depth {depth}: {count}"
+            for depth, count in sorted(self.depths.items()) if count
+        )
+        lines.append(f"  peak depth: {self.max_depth}")
+        lines.append(f"closures: {self.closures}")
+        lines.append(f"strings: {self.strings}")
+        lines.append(
+            f"  concatenated: {self.allocated_strings.count},"
+            f" {self.allocated_strings.bytes} bytes"
+        )
+        total_count = sum(count for count, _ in nodes.values())
+        total_size = sum(size for _, size in nodes.values())
+        lines.append(f"ast nodes: {total_count}, {total_size} bytes")
+        lines.extend(
+            f"  {name}: {count}, {size} bytes"
+            for name, (count, size) in sorted(nodes.items())
+        )
+        return '\n'.join(lines)
+
+
+def rope_size(rope):
+    # the flattened string it stands for, assuming one byte per character
+    return sys.getsizeof(rope) + sys.getsizeof('') + rope.length
+
+
+def closure_size(closure):
+    cells = len(closure.closure) * sys.getsizeof(environment.Cell())
+    return (
+        sys.getsizeof(closure) + sys.getsizeof(closure.__dict__)
+        + sys.getsizeof(closure.closure) + cells
+    )
+
+
+def node_size(node):
+    return sys.getsizeof(node) + sys.getsizeof(node.__dict__)
+
+
+# the untracked version, kept before install() replaces it
+concat = strings.concat
+
+
+def tracked_concat(left, right):
+    result = concat(left, right)
+    if type(result) is str:
+        size = sys.getsizeof(result)
+    else:
+        # a rope only adds itself and the appended part
+        size = sys.getsizeof(result) + len(right)
+    memstats.tracker.allocated_strings.add(size)
+    return result
+
+
+class TrackedFrame(list):
+    __slots__ = ('depth', 'size', '__weakref__')
+
+    def __init__(self, values):
+        super().__init__(values)
+        memstats.tracker.add_frame(self)
+
+    def __del__(self):
+        memstats.tracker.remove_frame(self)
+
+
+class TrackedCountedFrame(environment.CountedFrame):
+    def __init__(self, values):
+        super().__init__(values)
+        memstats.tracker.add_frame(self)
+
+    def __del__(self):
+        super().__del__()
+        memstats.tracker.remove_frame(self)
+
+
+class TrackedLoxFunction(function.LoxFunction):
+    def __init__(self, declaration, closure, is_initializer=False):
+        super().__init__(declaration, closure, is_initializer)
+        memstats.tracker.add_closure(self)
+
+    def __del__(self):
+        memstats.tracker.remove_closure(self)
+
+
+class TrackedCountedLoxFunction(function.CountedLoxFunction):
+    def __init__(self, declaration, closure, is_initializer=False):
+        super().__init__(declaration, closure, is_initializer)
+        memstats.tracker.add_closure(self)
+
+    def __del__(self):
+        super().__del__()
+        memstats.tracker.remove_closure(self)
+
+
+TRACKED_FRAMES = {
+    list: TrackedFrame,
+    environment.CountedFrame: TrackedCountedFrame,
+}
+
+TRACKED_CLOSURES = {
+    function.LoxFunction: TrackedLoxFunction,
+    function.CountedLoxFunction: TrackedCountedLoxFunction,
+}
@@ -1,12 +1,21 @@
 from .tokenizer import Tokenizer, TokenType
-from . import error, statements, expressions
+from . import error, statements, expressions, governor, environment, resolver, arrays, tasks, memstats
 
 class Interpreter:
-    def __init__(self, code):
+    def __init__(
+        self, code, limits=None, jobs=1, track_memory=False,
+        load_snapshot=None, save_snapshot=None, file_root=None,
+    ):
         self.code = code
+        self.governor = governor.Governor(limits)
+        self.jobs = jobs
+        self.track_memory = track_memory
+        self.load_snapshot = load_snapshot
+        self.save_snapshot = save_snapshot
+        self.file_root = file_root
 
     def tokenize(self, debug=False):
-        self.tokens = Tokenizer(debug).scan(self.code)
+        self.tokens = Tokenizer(debug, self.jobs).scan(self.code)
         self.current = 0
 
     def parse(self):
@@ -15,13 +24,31 @@ class Interpreter:
 
     def interpret(self):
         self.tokenize()
+        governor.install(self.governor)
+        if self.track_memory:
+            memstats.install()
+        if self.file_root is not None:
+            tasks.allow_files(self.file_root)
+        if self.load_snapshot is not None:
+            # pickle is only loaded when snapshots are used
+            from . import snapshot
+            snapshot.load(self.load_snapshot)
         while not self.is_at_end():
             if stmt := self.declaration():
+                memstats.add_tree(stmt)
+                frame_size = resolver.resolve(stmt)
+                environment.frame = environment.frame_class((None,) * frame_size)
                 stmt.evaluate()
+        tasks.drain()
+        if self.save_snapshot is not None:
+            from . import snapshot
+            snapshot.save(self.save_snapshot)
 
     # statements
     def declaration(self):
         try:
+            if self.match(TokenType.CLASS):
+                return self.class_declaration()
             if self.match(TokenType.FUN):
                 return self.function('function')
             if self.match(TokenType.VAR):
@@ -31,6 +58,20 @@ class Interpreter:
             self.synchronize()
             raise
 
+    def class_declaration(self):
+        name = self.consume(TokenType.IDENTIFIER, "Expect class name.")
+        if self.match(TokenType.LESS):
+            self.consume(TokenType.IDENTIFIER, "Expect superclass name.")
+            superclass = expressions.Variable(self.previous())
+        else:
+            superclass = None
+        self.consume(TokenType.LEFT_BRACE, "Expect '{' before class body.")
+        methods = []
+        while not self.check(TokenType.RIGHT_BRACE) and not self.is_at_end():
+            methods.append(self.function('method'))
+        self.consume(TokenType.RIGHT_BRACE, "Expect '}' after class body.")
+        return statements.Class(name, superclass, methods)
+
     def function(self, kind):
         name = self.consume(TokenType.IDENTIFIER, f"Expect {kind} name.")
         self.consume(TokenType.LEFT_PAREN, f"Expect '(' after {kind} name.")
@@ -74,14 +115,16 @@ class Interpreter:
         return self.expression_statement()
 
     def return_statement(self):
+        keyword = self.previous()
         if self.check(TokenType.SEMICOLON):
             value = None
         else:
             value = self.expression()
         self.consume(TokenType.SEMICOLON, "Expect ';' after return value.")
-        return statements.Return(value)
+        return statements.Return(keyword, value)
 
     def for_statement(self):
+        keyword = self.previous()
         self.consume(TokenType.LEFT_PAREN, "Expect '(' after 'for'.")
         if self.match(TokenType.SEMICOLON):
             initializer = None
@@ -103,18 +146,19 @@ class Interpreter:
         body = self.statement()
         if increment:
             body = statements.Block([body, statements.Expression(increment)])
-        body = statements.While(condition, body)
+        body = statements.While(condition, body, keyword)
         if initializer:
             body = statements.Block([initializer, body])
         return body
 
 
     def while_statement(self):
+        keyword = self.previous()
         self.consume(TokenType.LEFT_PAREN, "Expect '(' after 'while'.")
         condition = self.expression()
         self.consume(TokenType.RIGHT_PAREN, "Expect ')' after condition.")
         body = self.statement()
-        return statements.While(condition, body)
+        return statements.While(condition, body, keyword)
 
     def if_statement(self):
         self.consume(TokenType.LEFT_PAREN, "Expect '(' after 'if'.")
@@ -147,95 +191,74 @@ class Interpreter:
 
     # expressions
     def expression(self):
-        return self.assignment()
-
-    def or_(self):
-        expr = self.and_()
-        while self.match(TokenType.OR):
-            op = self.previous()
-            right = self.and_()
-            expr = expressions.Logical(expr, op, right)
-        return expr
-
-    def and_(self):
-        expr = self.equality()
-        while self.match(TokenType.AND):
-            op = self.previous()
-            right = self.equality()
-            expr = expressions.Logical(expr, op, right)
-        return expr
-
-    def assignment(self):
-        expr = self.or_()
-
-        if self.match(TokenType.EQUAL):
-            equals = self.previous()
-            value = self.assignment()
+        return self.parse_precedence(PREC_ASSIGNMENT)
 
-            if isinstance(expr, expressions.Variable):
-                name = expr.name
-                return expressions.Assignment(name, value)
-            raise error.EvaluationError(equals.line_no, 'Invalid assignment target.')
+    def parse_precedence(self, precedence):
+        token = self.peek()
+        if (prefix := PREFIX_RULES.get(token.type)) is None:
+            raise self.error("Expect expression.")
+        self.current += 1
+        expr = prefix(self, token)
+
+        # left-associative chains are consumed here in a loop, so only
+        # right operands and nested prefixes recurse
+        while (rule := INFIX_RULES.get(self.tokens[self.current].type)) is not None:
+            if rule[0] < precedence:
+                break
+            self.current += 1
+            expr = rule[1](self, expr, self.tokens[self.current - 1])
         return expr
 
-    def equality(self):
-        expr = self.comparison()
+    # prefix rules
+    def literal(self, token):
+        if token.type in KEYWORD_LITERALS:
+            return expressions.Literal(KEYWORD_LITERALS[token.type])
+        return expressions.Literal(token.literal)
 
-        while self.match(TokenType.BANG_EQUAL, TokenType.EQUAL_EQUAL):
-            operator = self.previous()
-            right = self.comparison()
-            expr = expressions.Binary(expr, operator, right)
+    def variable(self, token):
+        return expressions.Variable(token)
 
-        return expr
+    def grouping(self, token):
+        expr = self.expression()
+        self.consume(TokenType.RIGHT_PAREN, "Expect ')' after expression.")
+        return expressions.Grouping(expr)
 
-    def comparison(self):
-        expr = self.term()
+    def this(self, keyword):
+        return expressions.This(keyword)
 
-        while self.match(TokenType.GREATER, TokenType.GREATER_EQUAL, TokenType.LESS, TokenType.LESS_EQUAL):
-            operator = self.previous()
-            right = self.term()
-            expr = expressions.Binary(expr, operator, right)
+    def super_(self, keyword):
+        self.consume(TokenType.DOT, "Expect '.' after 'super'.")
+        method = self.consume(TokenType.IDENTIFIER, "Expect superclass method name.")
+        return expressions.Super(keyword, method)
 
-        return expr
+    def unary(self, operator):
+        right = self.parse_precedence(PREC_UNARY)
+        return expressions.Unary(operator, right)
 
-    def term(self):
-        expr = self.factor()
+    # infix rules
+    def binary(self, left, operator):
+        right = self.parse_precedence(INFIX_RULES[operator.type][0] + 1)
+        return expressions.Binary(left, operator, right)
 
-        while self.match(TokenType.MINUS, TokenType.PLUS):
-            operator = self.previous()
-            right = self.factor()
-            expr = expressions.Binary(expr, operator, right)
+    def logical(self, left, operator):
+        right = self.parse_precedence(INFIX_RULES[operator.type][0] + 1)
+        return expressions.Logical(left, operator, right)
 
-        return expr
+    def assignment(self, target, equals):
+        value = self.parse_precedence(PREC_ASSIGNMENT)
 
-    def factor(self):
-        expr = self.unary()
+        if isinstance(target, expressions.Get):
+            return expressions.Set(target.object, target.name, value)
+        if isinstance(target, expressions.Variable):
+            return expressions.Assignment(target.name, value)
+        raise error.ParseError(equals.line, 'Invalid assignment target.', f" at '{equals.lexeme}'")
 
-        while self.match(TokenType.SLASH, TokenType.STAR):
-            operator = self.previous()
-            right = self.unary()
-            expr = expressions.Binary(expr, operator, right)
+    def call(self, callee, paren):
+        return self.finish_call(callee)
 
-        return expr
-
-    def unary(self):
-        if self.match(TokenType.BANG, TokenType.MINUS):
-            operator = self.previous()
-            right = self.unary()
-            return expressions.Unary(operator, right)
-
-        return self.call()
-
-    def call(self):
-        expr = self.primary()
-
-        while True:
-            if self.match(TokenType.LEFT_PAREN):
-                expr = self.finish_call(expr)
-            else:
-                break
-
-        return expr
+    def dot(self, object, dot):
+        name = self.consume(TokenType.IDENTIFIER, "Expect property name after '.'.")
+        return expressions.Get(object, name)
 
     def finish_call(self, callee):
         arguments = []
@@ -247,30 +270,10 @@ class Interpreter:
                 if not self.match(TokenType.COMMA):
                     break
         paren = self.consume(TokenType.RIGHT_PAREN, "Expect ')' after arguments.")
+        if isinstance(callee, expressions.Get):
+            return expressions.Invoke(callee, paren, arguments)
         return expressions.Call(callee, paren, arguments)
 
-    def primary(self):
-        if self.match(TokenType.FALSE):
-            return expressions.Literal(False)
-        if self.match(TokenType.TRUE):
-            return expressions.Literal(True)
-        if self.match(TokenType.NIL):
-            return expressions.Literal(None)
-
-
-        if self.match(TokenType.NUMBER, TokenType.STRING):
-            return expressions.Literal(self.previous().literal)
-
-        if self.match(TokenType.IDENTIFIER):
-            return expressions.Variable(self.previous())
-
-        if self.match(TokenType.LEFT_PAREN):
-            expr = self.expression()
-            self.consume(TokenType.RIGHT_PAREN, "Expect ')' after expression.")
-            return expressions.Grouping(expr)
-
-        raise self.error("Expect expression.")
-
     # common utils
     def consume(self, type, msg):
         if self.check(type):
@@ -279,15 +282,14 @@ class Interpreter:
         raise self.error(msg)
 
     def match(self, *types):
-        for type in types:
-            if self.check(type):
-                self.advance()
-                return True
+        # EOF is never matched, so there is no need to test for the end
+        if self.tokens[self.current].type in types:
+            self.current += 1
+            return True
+        return False
 
     def check(self, type):
-        if self.is_at_end():
-            return False
-        return self.peek().type == type
+        return self.tokens[self.current].type == type
 
     def is_at_end(self):
         return self.peek().type == TokenType.EOF
@@ -332,3 +334,52 @@ class Interpreter:
 
             self.advance()
 
+
+# binding powers, from loosest to tightest
+PREC_ASSIGNMENT = 1
+PREC_OR = 2
+PREC_AND = 3
+PREC_EQUALITY = 4
+PREC_COMPARISON = 5
+PREC_TERM = 6
+PREC_FACTOR = 7
+PREC_UNARY = 8
+PREC_CALL = 9
+
+KEYWORD_LITERALS = {
+    TokenType.FALSE: False,
+    TokenType.TRUE: True,
+    TokenType.NIL: None,
+}
+
+PREFIX_RULES = {
+    TokenType.FALSE: Interpreter.literal,
+    TokenType.TRUE: Interpreter.literal,
+    TokenType.NIL: Interpreter.literal,
+    TokenType.NUMBER: Interpreter.literal,
+    TokenType.STRING: Interpreter.literal,
+    TokenType.IDENTIFIER: Interpreter.variable,
+    TokenType.THIS: Interpreter.this,
+    TokenType.SUPER: Interpreter.super_,
+    TokenType.LEFT_PAREN: Interpreter.grouping,
+    TokenType.BANG: Interpreter.unary,
+    TokenType.MINUS: Interpreter.unary,
+}
+
+INFIX_RULES = {
+    TokenType.EQUAL: (PREC_ASSIGNMENT, Interpreter.assignment),
+    TokenType.OR: (PREC_OR, Interpreter.logical),
+    TokenType.AND: (PREC_AND, Interpreter.logical),
+    TokenType.BANG_EQUAL: (PREC_EQUALITY, Interpreter.binary),
+    TokenType.EQUAL_EQUAL: (PREC_EQUALITY, Interpreter.binary),
+    TokenType.GREATER: (PREC_COMPARISON, Interpreter.binary),
+    TokenType.GREATER_EQUAL: (PREC_COMPARISON, Interpreter.binary),
+    TokenType.LESS: (PREC_COMPARISON, Interpreter.binary),
+    TokenType.LESS_EQUAL: (PREC_COMPARISON, Interpreter.binary),
+    TokenType.MINUS: (PREC_TERM, Interpreter.binary),
+    TokenType.PLUS: (PREC_TERM, Interpreter.binary),
+    TokenType.SLASH: (PREC_FACTOR, Interpreter.binary),
+    TokenType.STAR: (PREC_FACTOR, Interpreter.binary),
+    TokenType.LEFT_PAREN: (PREC_CALL, Interpreter.call),
+    TokenType.DOT: (PREC_CALL, Interpreter.dot),
+}
@@ -1,25 +1,52 @@
-from .interpreter import Interpreter
-from . import error, utils
+from .tokenizer import Tokenizer
+from . import error, output, utils
+
+
+def create_interpreter(code, options):
+    # imported here so that `tokenize` doesn't load the evaluator
+    from . import governor
+    from .interpreter import Interpreter
+
+    limits = governor.Limits(
+        max_steps=options.max_steps,
+        timeout=options.timeout,
+        max_environments=options.max_environments,
+        max_closures=options.max_closures,
+        max_call_depth=options.max_call_depth,
+        max_array_bytes=options.max_array_bytes,
+        max_tasks=options.max_tasks,
+    )
+    return Interpreter(
+        code, limits, options.jobs, options.memstats,
+        options.snapshot, options.save_snapshot, options.file_root,
+    )
 
 
 def main():
     command, code = utils.get_code()
-    interpreter = Interpreter(code)
+    options = utils.get_options()
     match command:
         case 'tokenize':
-            interpreter.tokenize(True)
+            Tokenizer(True, options.jobs).scan(code)
         case 'parse':
+            interpreter = create_interpreter(code, options)
             with error.handled_error():
                 if expression := interpreter.parse():
-                    print(expression)
+                    output.write(str(expression))
         case 'evaluate':
+            interpreter = create_interpreter(code, options)
             with error.handled_error():
                 if (tree := interpreter.parse()) is not None:
-                    print(utils.to_str(tree.evaluate(), True))
+                    output.write(utils.to_str(tree.evaluate(), True))
         case 'run':
+            interpreter = create_interpreter(code, options)
             with error.handled_error():
                 interpreter.interpret()
 
+    output.flush()
+    if options.memstats:
+        from . import memstats
+        memstats.print_report()
     if error.error_code:
         raise SystemExit(error.error_code)
 
@@ -0,0 +1,46 @@
+import sys
+
+from app.error import NativeError
+from app.function import Callable
+from . import environment
+
+# Natives for memory statistics. Allocation tracking lives in app.heap and
+# is only installed for `--memstats`; without it nothing is counted.
+
+
+tracker = None
+
+
+def install():
+    global tracker
+    if tracker is None:
+        from .heap import Tracker
+        tracker = Tracker()
+    tracker.install()
+
+
+def add_tree(stmt):
+    if tracker is not None:
+        tracker.add_tree(stmt)
+
+
+def print_report():
+    if tracker is not None:
+        sys.stderr.write(tracker.report() + '\n')
+
+
+class MemStats(Callable):
+    def call(self, argumnets):
+        if tracker is None:
+            raise NativeError("Memory statistics are off, run with --memstats.")
+        return tracker.report()
+
+    def arity(self):
+        return 0
+
+
+NATIVES = {
+    'memstats': MemStats(),
+}
+
+environment.register_natives(NATIVES)
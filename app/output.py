@@ -0,0 +1,30 @@
+import atexit
+import sys
+
+# Lines are accumulated here and written to stdout in bulk. Anything that
+# writes to stderr must call `flush` first so diagnostics stay in order.
+BUFFER_SIZE = 1 << 16
+
+_lines = []
+_size = 0
+
+
+def write(line):
+    global _size
+    _lines.append(line)
+    _size += len(line) + 1
+    if _size >= BUFFER_SIZE:
+        flush()
+
+
+def flush():
+    global _size
+    if _lines:
+        _lines.append('')
+        sys.stdout.write('\n'.join(_lines))
+        _lines.clear()
+        _size = 0
+    sys.stdout.flush()
+
+
+atexit.register(flush)
@@ -0,0 +1,134 @@
+# Static scope resolution, run on each top-level statement before it is
+# evaluated. Every local variable gets a slot in the frame of the function
+# (or top-level statement) that declares it. Only slots referenced from a
+# nested function are marked as captured: those hold a Cell, and a closure
+# keeps just the cells it uses instead of the whole enclosing scope chain.
+# Names that are not found in any enclosing local scope are globals.
+from .error import ParseError
+
+
+class Slot:
+    def __init__(self, index):
+        self.index = index
+        self.captured = False
+        # nodes that read, write or declare this slot
+        self.users = []
+
+
+class FunctionScope:
+    def __init__(self, enclosing=None, kind=None, class_kind=None):
+        self.enclosing = enclosing
+        # 'function', 'method' or 'initializer'; None for top-level code
+        self.kind = kind
+        # 'class' or 'subclass' inside methods, inherited by nested functions
+        if class_kind is None and enclosing is not None:
+            class_kind = enclosing.class_kind
+        self.class_kind = class_kind
+        self.blocks = []
+        self.slots = []
+        self.free = {}
+        # (slot in the enclosing frame, slot in this frame) for every cell
+        # the closure has to carry
+        self.captures = []
+
+    def new_slot(self):
+        slot = Slot(len(self.slots))
+        self.slots.append(slot)
+        return slot
+
+    def begin_block(self):
+        self.blocks.append({})
+
+    def end_block(self):
+        self.blocks.pop()
+
+    def declare(self, node):
+        # outside of any block, declarations are globals
+        if not self.blocks:
+            return
+        slot = self.new_slot()
+        self.blocks[-1][node.name.lexeme] = slot
+        slot.users.append(node)
+
+    def declare_name(self, name):
+        slot = self.new_slot()
+        self.blocks[-1][name] = slot
+        return slot
+
+    def lookup(self, name):
+        for block in reversed(self.blocks):
+            if name in block:
+                return block[name]
+        if name in self.free:
+            return self.free[name]
+        if self.enclosing is None:
+            return None
+        outer = self.enclosing.lookup(name)
+        if outer is None:
+            return None
+        outer.captured = True
+        slot = self.new_slot()
+        slot.captured = True
+        self.free[name] = slot
+        self.captures.append((outer.index, slot.index))
+        return slot
+
+    def reference(self, node):
+        if (slot := self.lookup(node.name.lexeme)) is not None:
+            slot.users.append(node)
+
+    def finish(self):
+        for slot in self.slots:
+            for node in slot.users:
+                node.bind(slot)
+        return len(self.slots)
+
+
+def resolve(stmt):
+    scope = FunctionScope()
+    stmt.resolve(scope)
+    return scope.finish()
+
+
+def error(token, msg):
+    return ParseError(token.line, msg, f" at '{token.lexeme}'")
+
+
+def resolve_function(declaration, enclosing, kind='function', class_kind=None):
+    scope = FunctionScope(enclosing, kind, class_kind)
+    scope.begin_block()
+    for param in declaration.params:
+        scope.declare_name(param.lexeme)
+    # methods get the receiver as an extra argument after the parameters
+    n_args = len(declaration.params)
+    if kind != 'function':
+        scope.declare_name('this')
+        n_args += 1
+    declaration.body.resolve(scope)
+    scope.end_block()
+
+    declaration.frame_template = (None,) * scope.finish()
+    declaration.captures = tuple(outer for outer, _ in scope.captures)
+    declaration.free_slots = tuple(inner for _, inner in scope.captures)
+    declaration.captured_params = tuple(i for i in range(n_args) if scope.slots[i].captured)
+
+
+def resolve_class(declaration, scope):
+    if (superclass := declaration.superclass) is not None:
+        if superclass.name.lexeme == declaration.name.lexeme:
+            raise error(superclass.name, "A class can't inherit from itself.")
+        superclass.resolve(scope)
+        # methods reach the superclass through a `super` variable declared
+        # in a scope around them
+        scope.begin_block()
+        declaration.super_slot = scope.declare_name('super').index
+        class_kind = 'subclass'
+    else:
+        class_kind = 'class'
+
+    for method in declaration.methods:
+        kind = 'initializer' if method.name.lexeme == 'init' else 'method'
+        resolve_function(method, scope, kind, class_kind)
+
+    if superclass is not None:
+        scope.end_block()
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from app.error import NativeError, ResourceLimitError
+from . import environment, governor
+
+# Every Lox task runs on its own thread, but only the thread holding the
+# turn executes Lox code. A task gives up its turn while it waits on an
+# async native (run on the scheduler's asyncio loop) or on another task, and
+# turns are handed out in FIFO order, so tasks that don't wait run one after
+# another in spawn order and each task's output stays in program order.
+
+# every live task holds a thread, so there is a cap even without limits
+MAX_TASKS = 10000
+
+
+class LoxTask:
+    def __init__(self, function):
+        self.function = function
+        self.turn = threading.Event()
+        self.done = threading.Event()
+        self.thread = None
+        # the task this one is blocked on in await(), to detect cycles
+        self.awaiting = None
+        self.result = None
+        self.error = None
+        self.observed = False
+
+    def __str__(self):
+        return f"<task {self.function.declaration.name.lexeme}>"
+
+
+class Scheduler:
+    def __init__(self):
+        self.mutex = threading.Lock()
+        # the thread that created the scheduler is the one running
+        self.running = True
+        self.waiting = deque()
+        self.tasks = []
+        # spawned and not finished yet, only changed by the turn holder
+        self.live = 0
+        self.local = threading.local()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def acquire(self):
+        with self.mutex:
+            if not self.running and not self.waiting:
+                self.running = True
+                return
+            turn = threading.Event()
+            self.waiting.append(turn)
+        turn.wait()
+
+    def release(self):
+        with self.mutex:
+            if self.waiting:
+                self.waiting.popleft().set()
+            else:
+                self.running = False
+
+    @contextmanager
+    def suspended(self):
+        frame, depth = environment.frame, governor.current.depth
+        self.release()
+        try:
+            yield
+        finally:
+            self.acquire()
+            environment.frame, governor.current.depth = frame, depth
+
+    def spawn(self, function):
+        governor.current.allocate_task(self.live)
+        if self.live >= MAX_TASKS:
+            raise NativeError("Too many tasks running at once.")
+        task = LoxTask(function)
+        task.thread = threading.Thread(target=self.run, args=(task,), daemon=True)
+        with self.mutex:
+            self.waiting.append(task.turn)
+        try:
+            task.thread.start()
+        except RuntimeError:
+            with self.mutex:
+                self.waiting.remove(task.turn)
+            raise NativeError("Could not start task.")
+        self.tasks.append(task)
+        self.live += 1
+        return task
+
+    def run(self, task):
+        task.turn.wait()
+        self.local.task = task
+        environment.frame, governor.current.depth = [], 0
+        try:
+            task.result = task.function.call([])
+        except Exception as e:
+            task.error = e
+        finally:
+            self.live -= 1
+            task.done.set()
+            self.release()
+
+    def current_task(self):
+        # None on the main thread
+        return getattr(self.local, 'task', None)
+
+    def wait(self, task):
+        current = self.current_task()
+        if task is current:
+            raise NativeError("A task can't await itself.")
+        if not task.done.is_set():
+            # only the thread holding the turn touches `awaiting`
+            waited = task.awaiting
+            while waited is not None:
+                if waited is current:
+                    raise NativeError("Tasks can't await each other in a cycle.")
+                waited = waited.awaiting
+            if current is not None:
+                current.awaiting = task
+            try:
+                with self.suspended():
+                    done = task.done.wait(governor.current.time_left())
+            finally:
+                if current is not None:
+                    current.awaiting = None
+            if not done:
+                raise ResourceLimitError('Execution time limit exceeded.')
+        task.observed = True
+        if task.error is not None:
+            raise task.error
+        return task.result
+
+    def run_async(self, coroutine):
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        with self.suspended():
+            try:
+                return future.result(governor.current.time_left())
+            except TimeoutError:
+                # the native itself may have failed with a TimeoutError
+                if future.done():
+                    raise
+                future.cancel()
+                raise ResourceLimitError('Execution time limit exceeded.')
+
+    def sleep(self, seconds):
+        self.run_async(asyncio.sleep(seconds))
+
+    def run_in_thread(self, function, *args):
+        return self.run_async(asyncio.to_thread(function, *args))
+
+    def is_task(self, value):
+        return isinstance(value, LoxTask)
+
+    def drain(self):
+        # tasks may spawn more tasks while we wait, so don't iterate a copy
+        i = 0
+        while i < len(self.tasks):
+            task = self.tasks[i]
+            if not task.observed:
+                self.wait(task)
+            i += 1
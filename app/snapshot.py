@@ -0,0 +1,89 @@
+import gc
+import os
+import pickle
+
+from . import environment, memstats
+from .classes import LoxClass
+from .error import ResourceLimitError, SnapshotError
+from .function import LoxFunction
+
+# A run with --save-snapshot pickles the global environment it leaves
+# behind: functions with their resolved declarations and closure cells,
+# classes, instances and plain values. A run with --snapshot loads those
+# globals before executing its own script, instead of parsing and running
+# the prelude that produced them again. Natives are stored by name and
+# resolved against the loading interpreter's own.
+#
+# Snapshots are pickles, so only load files written by a trusted run.
+
+# bump whenever AST nodes or runtime values change in a way old
+# snapshots can't be loaded into
+VERSION = 1
+
+
+class Pickler(pickle.Pickler):
+    def __init__(self, file):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.natives = {id(native): name for name, native in environment.NATIVES.items()}
+
+    def persistent_id(self, obj):
+        return self.natives.get(id(obj))
+
+
+class Unpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        if pid not in environment.NATIVES:
+            raise SnapshotError(f"Snapshot refers to unknown native '{pid}'.")
+        return environment.NATIVES[pid]
+
+
+def save(path):
+    tmp_path = f'{path}.tmp'
+    try:
+        with open(tmp_path, 'wb') as file:
+            pickler = Pickler(file)
+            pickler.dump(VERSION)
+            pickler.dump(environment.env.values)
+        os.replace(tmp_path, path)
+    except OSError:
+        raise SnapshotError(f"Could not write snapshot '{path}'.")
+    except (pickle.PicklingError, TypeError) as e:
+        os.remove(tmp_path)
+        raise SnapshotError(f"Could not save globals to snapshot: {e}.")
+    except RecursionError:
+        os.remove(tmp_path)
+        raise SnapshotError("Globals are nested too deeply to snapshot.")
+
+
+def load(path):
+    # unpickling allocates nothing but live objects, so keep the cycle
+    # collector from repeatedly scanning the growing heap meanwhile, and
+    # freeze the result so later collections (and the ones at exit) skip
+    # it. Reference cycles among loaded values then live until exit,
+    # which suits globals that a prelude set up to be used all along.
+    gc.disable()
+    try:
+        with open(path, 'rb') as file:
+            unpickler = Unpickler(file)
+            if unpickler.load() != VERSION:
+                raise SnapshotError(f"Snapshot '{path}' was written by an incompatible version.")
+            values = unpickler.load()
+    except OSError:
+        raise SnapshotError(f"Could not read snapshot '{path}'.")
+    # loaded closures and arrays count against the governor's caps
+    except (SnapshotError, ResourceLimitError):
+        raise
+    except Exception:
+        # a damaged file can make unpickling fail in many different ways
+        raise SnapshotError(f"Snapshot '{path}' is damaged.")
+    finally:
+        gc.freeze()
+        gc.enable()
+
+    environment.env.values.update(values)
+    for value in values.values():
+        if isinstance(value, LoxFunction):
+            memstats.add_tree(value.declaration)
+        elif isinstance(value, LoxClass):
+            for method in value.methods.values():
+                memstats.add_tree(method.declaration)
@@ -1,54 +1,120 @@
-from dataclasses import dataclass
-
-from . import utils, environment, error
-from .expressions import Expr
+from . import utils, environment, error, output, function, governor, resolver, classes
+from .expressions import Expr, Variable
 from .tokenizer import Token
-from .function import LoxFunction
 
 
 class Statement:
+    fields = ()
+
     def evaluate(self): ...
+    def resolve(self, scope): ...
+
+    def __repr__(self):
+        return utils.node_repr(self)
+
+
+class Declaration(Statement):
+    # named functions and classes; the resolver binds the name to a frame
+    # slot, unresolved names are globals
+    slot = None
+    captured = False
+
+    def bind(self, slot):
+        self.slot = slot.index
+        self.captured = slot.captured
+
+    def declare(self, frame):
+        if self.captured:
+            # created first so that the value can capture its own name
+            frame[self.slot] = environment.Cell()
+
+    def define(self, frame, value):
+        if self.slot is None:
+            environment.set_env(self.name.lexeme, value)
+        elif self.captured:
+            frame[self.slot].value = value
+        else:
+            frame[self.slot] = value
 
-@dataclass
 class Print(Statement):
-    expression: Expr
+    fields = ('expression',)
+
+    def __init__(self, expression: Expr):
+        self.expression = expression
 
     def evaluate(self):
         value = self.expression.evaluate()
-        print(utils.to_str(value, True))
+        output.write(utils.to_str(value, True))
+
+    def resolve(self, scope):
+        self.expression.resolve(scope)
 
-@dataclass
 class Expression(Statement):
-    expression: Expr
+    fields = ('expression',)
+
+    def __init__(self, expression: Expr):
+        self.expression = expression
 
     def evaluate(self):
         self.expression.evaluate()
 
+    def resolve(self, scope):
+        self.expression.resolve(scope)
+
 
-@dataclass
 class Var(Statement):
-    name: Token
-    initializer: Expr
+    fields = ('name', 'initializer')
 
+    def __init__(self, name: Token, initializer: Expr):
+        self.name = name
+        self.initializer = initializer
+
+    # unresolved declarations are globals
     def evaluate(self):
         environment.set_env(self.name.lexeme, self.initializer.evaluate())
 
+    def resolve(self, scope):
+        self.initializer.resolve(scope)
+        scope.declare(self)
+
+    def bind(self, slot):
+        self.slot = slot.index
+        self.__class__ = CellVar if slot.captured else LocalVar
+
+class LocalVar(Var):
+    def evaluate(self):
+        environment.frame[self.slot] = self.initializer.evaluate()
+
+class CellVar(Var):
+    # every execution of the declaration creates a new variable
+    def evaluate(self):
+        environment.frame[self.slot] = environment.Cell(self.initializer.evaluate())
+
 
-@dataclass
 class Block(Statement):
-    statements: list[Statement]
+    fields = ('statements',)
+
+    def __init__(self, statements: list[Statement]):
+        self.statements = statements
 
     def evaluate(self):
-        with environment.enclosing():
-            for stmt in self.statements:
-                stmt.evaluate()
+        for stmt in self.statements:
+            stmt.evaluate()
+
+    def resolve(self, scope):
+        scope.begin_block()
+        for stmt in self.statements:
+            stmt.resolve(scope)
+        scope.end_block()
 
 
-@dataclass
 class If(Statement):
-    condition: Expr
-    thenBranch: Statement
-    elseBranch: Statement | None
+    fields = ('condition', 'thenBranch', 'elseBranch')
+
+    def __init__(self, condition: Expr, thenBranch: Statement, elseBranch: Statement | None):
+        self.condition = condition
+        self.thenBranch = thenBranch
+        self.elseBranch = elseBranch
 
     def evaluate(self):
         if utils.is_truthy(self.condition.evaluate()):
@@ -56,29 +122,98 @@ class If(Statement):
         elif self.elseBranch:
             self.elseBranch.evaluate()
 
+    def resolve(self, scope):
+        self.condition.resolve(scope)
+        self.thenBranch.resolve(scope)
+        if self.elseBranch:
+            self.elseBranch.resolve(scope)
+
 
-@dataclass
 class While(Statement):
-    condition: Expr
-    body: Statement
+    fields = ('condition', 'body', 'keyword')
+
+    def __init__(self, condition: Expr, body: Statement, keyword: Token):
+        self.condition = condition
+        self.body = body
+        self.keyword = keyword
 
     def evaluate(self):
+        gov = governor.current
         while utils.is_truthy(self.condition.evaluate()):
+            gov.ticks -= 1
+            if gov.ticks < 0:
+                gov.checkpoint(self.keyword.line)
             self.body.evaluate()
 
+    def resolve(self, scope):
+        self.condition.resolve(scope)
+        self.body.resolve(scope)
 
-@dataclass
-class Function(Statement):
-    name: Token
-    params: list[Token]
-    body: Block
+
+class Function(Declaration):
+    fields = ('name', 'params', 'body')
+
+    def __init__(self, name: Token, params: list[Token], body: Block):
+        self.name = name
+        self.params = params
+        self.body = body
+
+    # filled in by the resolver
+    frame_template = ()
+    captures = ()
+    free_slots = ()
+    captured_params = ()
 
     def evaluate(self):
-        environment.set_env(self.name.lexeme, LoxFunction(self, environment.env))
+        frame = environment.frame
+        self.declare(frame)
+        self.define(frame, self.closure(frame))
+
+    def closure(self, frame, is_initializer=False):
+        cells = tuple(frame[i] for i in self.captures)
+        return function.closure_class(self, cells, is_initializer)
+
+    def resolve(self, scope):
+        scope.declare(self)
+        resolver.resolve_function(self, scope)
+
+
+class Class(Declaration):
+    fields = ('name', 'superclass', 'methods')
+
+    def __init__(self, name: Token, superclass: Variable | None, methods: list[Function]):
+        self.name = name
+        self.superclass = superclass
+        self.methods = methods
+
+    # filled in by the resolver when there is a superclass
+    super_slot = None
+
+    def evaluate(self):
+        frame = environment.frame
+        superclass = None
+        if self.superclass is not None:
+            superclass = self.superclass.evaluate()
+            if not isinstance(superclass, classes.LoxClass):
+                raise error.EvaluationError(self.superclass.name.line, "Superclass must be a class.")
+            frame[self.super_slot] = environment.Cell(superclass)
+        self.declare(frame)
+        methods = {
+            method.name.lexeme: method.closure(frame, method.name.lexeme == 'init')
+            for method in self.methods
+        }
+        self.define(frame, classes.LoxClass(self.name.lexeme, superclass, methods))
+
+    def resolve(self, scope):
+        scope.declare(self)
+        resolver.resolve_class(self, scope)
 
-@dataclass
 class Return(Statement):
-    value: Expr | None
+    fields = ('keyword', 'value')
+
+    def __init__(self, keyword: Token, value: Expr | None):
+        self.keyword = keyword
+        self.value = value
 
     def evaluate(self):
         if self.value:
@@ -86,3 +221,9 @@ class Return(Statement):
         else:
             value = None
         raise error.Return(value)
+
+    def resolve(self, scope):
+        if self.value:
+            if scope.kind == 'initializer':
+                raise resolver.error(self.keyword, "Can't return a value from an initializer.")
+            self.value.resolve(scope)
@@ -0,0 +1,52 @@
+# Results of string concatenation that are long enough are kept as a Rope:
+# a list of parts that is only joined when the string is actually needed
+# (printed, compared or hashed). Appending to the newest rope built on a
+# parts list reuses that list, so `s = s + line;` in a loop stays linear.
+ROPE_THRESHOLD = 256
+
+
+class Rope:
+    __slots__ = ('parts', 'count', 'length', 'flat')
+
+    def __init__(self, parts, length):
+        self.parts = parts
+        self.count = len(parts)
+        self.length = length
+        self.flat = None
+
+    def __str__(self):
+        if self.flat is None:
+            self.flat = ''.join(self.parts[:self.count])
+        return self.flat
+
+    def __len__(self):
+        return self.length
+
+    def __eq__(self, other):
+        if isinstance(other, (str, Rope)):
+            return self.length == len(other) and str(self) == str(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(str(self))
+
+
+def is_string(value):
+    return isinstance(value, (str, Rope))
+
+
+def concat(left, right):
+    if type(right) is Rope:
+        right = str(right)
+    if type(left) is Rope:
+        parts = left.parts
+        # only the latest rope on a parts list may extend it in place,
+        # older ropes sharing the list still see their own prefix
+        if left.count == len(parts):
+            parts.append(right)
+            return Rope(parts, left.length + len(right))
+        left = str(left)
+    length = len(left) + len(right)
+    if length < ROPE_THRESHOLD:
+        return left + right
+    return Rope([left, right], length)
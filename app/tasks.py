@@ -0,0 +1,131 @@
+import os
+
+from app.error import NativeError
+from app.function import Callable, LoxFunction
+from . import strings, environment
+
+# Natives for Lox tasks. The scheduler that runs them lives in
+# app.scheduler and is only created when a script first uses one.
+#
+# Scripts get no file access unless a file root is given: readFile and
+# writeFile are only registered by allow_files(), and only reach paths
+# inside that directory.
+
+
+scheduler = None
+file_root = None
+
+
+def get_scheduler():
+    global scheduler
+    if scheduler is None:
+        # threads and asyncio are only loaded once a script uses tasks
+        from .scheduler import Scheduler
+        scheduler = Scheduler()
+    return scheduler
+
+
+def drain():
+    if scheduler is not None:
+        scheduler.drain()
+
+
+def allow_files(root):
+    global file_root
+    file_root = os.path.realpath(root)
+    environment.register_natives(FILE_NATIVES)
+
+
+def check_path(value):
+    if not strings.is_string(value):
+        raise NativeError("Path must be a string.")
+    # symlinks are resolved too, so they can't lead out of the root
+    path = os.path.realpath(os.path.join(file_root, str(value)))
+    if os.path.commonpath([file_root, path]) != file_root:
+        raise NativeError(f"Path '{value}' is outside the file root.")
+    return path
+
+
+def read_file(path):
+    with open(path, encoding='utf-8') as file:
+        return file.read()
+
+
+def write_file(path, text):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(text)
+
+
+class Spawn(Callable):
+    def call(self, argumnets):
+        function = argumnets[0]
+        if not isinstance(function, LoxFunction) or function.arity() != 0:
+            raise NativeError("Can only spawn functions that take no arguments.")
+        return get_scheduler().spawn(function)
+
+    def arity(self):
+        return 1
+
+
+class Await(Callable):
+    def call(self, argumnets):
+        # without a scheduler no task has been spawned yet
+        if scheduler is None or not scheduler.is_task(argumnets[0]):
+            raise NativeError("Can only await tasks.")
+        return scheduler.wait(argumnets[0])
+
+    def arity(self):
+        return 1
+
+
+class Sleep(Callable):
+    def call(self, argumnets):
+        seconds = argumnets[0]
+        if not isinstance(seconds, float) or not seconds >= 0:
+            raise NativeError("Sleep time must be a non-negative number.")
+        get_scheduler().sleep(seconds)
+
+    def arity(self):
+        return 1
+
+
+class ReadFile(Callable):
+    def call(self, argumnets):
+        path = check_path(argumnets[0])
+        try:
+            return get_scheduler().run_in_thread(read_file, path)
+        # ValueError covers files that aren't valid UTF-8
+        except (OSError, ValueError):
+            raise NativeError(f"Could not read file '{argumnets[0]}'.")
+
+    def arity(self):
+        return 1
+
+
+class WriteFile(Callable):
+    def call(self, argumnets):
+        path = check_path(argumnets[0])
+        if not strings.is_string(argumnets[1]):
+            raise NativeError("File contents must be a string.")
+        text = str(argumnets[1])
+        try:
+            get_scheduler().run_in_thread(write_file, path, text)
+        except (OSError, ValueError):
+            raise NativeError(f"Could not write file '{argumnets[0]}'.")
+
+    def arity(self):
+        return 2
+
+
+NATIVES = {
+    'spawn': Spawn(),
+    'await': Await(),
+    'sleep': Sleep(),
+}
+
+FILE_NATIVES = {
+    'readFile': ReadFile(),
+    'writeFile': WriteFile(),
+}
+
+environment.register_natives(NATIVES)
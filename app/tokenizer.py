@@ -1,49 +1,49 @@
-from enum import StrEnum, auto
-import string
-from typing import NamedTuple
-from app import error
-
-
-class TokenType(StrEnum):
-    LEFT_PAREN = auto()
-    RIGHT_PAREN = auto()
-    LEFT_BRACE = auto()
-    RIGHT_BRACE = auto()
-    STAR = auto()
-    SLASH = auto()
-    DOT = auto()
-    COMMA = auto()
-    PLUS = auto()
-    MINUS = auto()
-    SEMICOLON = auto()
-    EQUAL = auto()
-    BANG = auto()
-    LESS = auto()
-    GREATER = auto()
-    EQUAL_EQUAL = auto()
-    BANG_EQUAL = auto()
-    LESS_EQUAL = auto()
-    GREATER_EQUAL = auto()
-    STRING = auto()
-    NUMBER = auto()
-    IDENTIFIER = auto()
-    EOF = auto()
-    AND = auto()
-    CLASS = auto()
-    ELSE = auto()
-    FALSE = auto()
-    FOR = auto()
-    FUN = auto()
-    IF = auto()
-    NIL = auto()
-    OR = auto()
-    PRINT = auto()
-    RETURN = auto()
-    SUPER = auto()
-    THIS = auto()
-    TRUE = auto()
-    VAR = auto()
-    WHILE = auto()
+from app import error, output
+
+
+# Plain string constants rather than an enum, and a hand-written Token
+# rather than a NamedTuple: both are built on every start, and this module
+# is all the `tokenize` command loads.
+class TokenType:
+    LEFT_PAREN = 'left_paren'
+    RIGHT_PAREN = 'right_paren'
+    LEFT_BRACE = 'left_brace'
+    RIGHT_BRACE = 'right_brace'
+    STAR = 'star'
+    SLASH = 'slash'
+    DOT = 'dot'
+    COMMA = 'comma'
+    PLUS = 'plus'
+    MINUS = 'minus'
+    SEMICOLON = 'semicolon'
+    EQUAL = 'equal'
+    BANG = 'bang'
+    LESS = 'less'
+    GREATER = 'greater'
+    EQUAL_EQUAL = 'equal_equal'
+    BANG_EQUAL = 'bang_equal'
+    LESS_EQUAL = 'less_equal'
+    GREATER_EQUAL = 'greater_equal'
+    STRING = 'string'
+    NUMBER = 'number'
+    IDENTIFIER = 'identifier'
+    EOF = 'eof'
+    AND = 'and'
+    CLASS = 'class'
+    ELSE = 'else'
+    FALSE = 'false'
+    FOR = 'for'
+    FUN = 'fun'
+    IF = 'if'
+    NIL = 'nil'
+    OR = 'or'
+    PRINT = 'print'
+    RETURN = 'return'
+    SUPER = 'super'
+    THIS = 'this'
+    TRUE = 'true'
+    VAR = 'var'
+    WHILE = 'while'
 
 
 RESERVED_WORDS = {
@@ -87,33 +87,99 @@ ONE_OR_TWO_CHAR_TOKENS = {
     '>=': TokenType.GREATER_EQUAL,
 }
 
+WHITESPACE = ' \t\n\r\x0b\x0c'
+DIGITS = '0123456789'
 COMPARISON_TOKEN_START = '=!<>'
-NUMBER_TOKEN_CHARS = '.' + string.digits
-IDENTIFIER_TOKEN_START = string.ascii_letters + '_'
-IDENTIFIER_TOKEN_CHARS = IDENTIFIER_TOKEN_START + string.digits
+NUMBER_TOKEN_CHARS = '.' + DIGITS
+IDENTIFIER_TOKEN_START = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_'
+IDENTIFIER_TOKEN_CHARS = IDENTIFIER_TOKEN_START + DIGITS
+
+
+class Token:
+    __slots__ = ('type', 'lexeme', 'literal', 'line')
 
+    def __init__(self, type: str, lexeme: str, literal: str | float | bool | None, line: int = 0):
+        self.type = type
+        self.lexeme = lexeme
+        self.literal = literal
+        self.line = line
 
-class Token(NamedTuple):
-    type: TokenType
-    lexeme: str
-    literal: str | float | bool | None
-    line: int = 0
+    def __reduce__(self):
+        # much smaller and faster to load from a snapshot than slot state
+        return Token, (self.type, self.lexeme, self.literal, self.line)
+
+    def __repr__(self) -> str:
+        # token types print the way the TokenType enum they replaced did
+        type = f'<TokenType.{self.type.upper()}: {self.type!r}>'
+        return f'Token(type={type}, lexeme={self.lexeme!r}, literal={self.literal!r}, line={self.line!r})'
 
     def __str__(self) -> str:
         return f'{self.type.upper()} {self.lexeme} {self.literal}'
 
+# sources at least this long are split across processes when jobs > 1
+PARALLEL_THRESHOLD = 1 << 20
+CHUNKS_PER_JOB = 4
+
+STRING_OR_COMMENT = r'"|//'
+
+# token types travel between processes as their index in this list
+TOKEN_TYPES = [value for name, value in vars(TokenType).items() if name.isupper()]
+TOKEN_TYPE_INDEX = {token_type: i for i, token_type in enumerate(TOKEN_TYPES)}
+
+
 class Tokenizer:
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, jobs=1):
         self.debug = debug
+        self.jobs = jobs
+        # errors are collected here instead of reported when scanning a chunk
+        # in a worker process, as (token index, line, message)
+        self.errors = None
 
     def add_token(self, token_type, lexeme, literal, line):
         token = Token(token_type, lexeme, literal, line)
         self.tokens.append(token)
         if self.debug:
-            print(token)
+            output.write(str(token))
+
+    def add_tokens(self, tokens):
+        self.tokens.extend(tokens)
+        if self.debug:
+            for token in tokens:
+                output.write(str(token))
 
+    def error(self, line_no, msg):
+        if self.errors is not None:
+            self.errors.append((len(self.tokens), line_no, msg))
+            return
+        with error.handled_error():
+            raise error.ParseError(line_no, msg)
 
     def scan(self, code):
+        self.tokens = []
+        if self.jobs > 1 and len(code) >= PARALLEL_THRESHOLD:
+            self.scan_parallel(code)
+        else:
+            self.scan_source(code)
+        self.add_token(TokenType.EOF, '',  'null', -1)
+        return self.tokens
+
+    def scan_parallel(self, code):
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunks = split_source(code, self.jobs * CHUNKS_PER_JOB)
+        with ProcessPoolExecutor(self.jobs) as pool:
+            results = pool.map(scan_chunk, chunks)
+            # replay each chunk's errors between its tokens, in chunk order
+            for columns, errors in results:
+                tokens = unpack_tokens(columns)
+                start = 0
+                for index, line_no, msg in errors:
+                    self.add_tokens(tokens[start:index])
+                    self.error(line_no, msg)
+                    start = index
+                self.add_tokens(tokens[start:])
+
+    def scan_source(self, code, line_no=1):
         def next_match(char):
             next_idx = current_idx + 1
             if next_idx < n_code and (next_c := code[next_idx]) == char:
@@ -125,8 +191,7 @@ class Tokenizer:
                 s = code[current_idx+1:end]
                 self.add_token(TokenType.STRING, f'"{s}"', s, line_no)
                 return len(s) + 2
-            with error.handled_error():
-                raise error.ParseError(line_no, 'Unterminated string.')
+            self.error(line_no, 'Unterminated string.')
 
         def number():
             i = current_idx
@@ -134,8 +199,7 @@ class Tokenizer:
                 i += 1
             num = code[current_idx:i]
             if num.endswith('.') or len([x for x in num if x == '.']) > 1:
-                with error.handled_error():
-                    raise error.ParseError(line_no, f'Invalid number {num}')
+                self.error(line_no, f'Invalid number {num}')
             else:
                 self.add_token(TokenType.NUMBER, num, float(num), line_no)
             return len(num)
@@ -152,15 +216,14 @@ class Tokenizer:
             return len(ident)
 
 
-        self.tokens = []
-        line_no, current_idx = 1, 0
+        current_idx = 0
         n_code = len(code)
         while 0 <= current_idx < n_code:
             c = code[current_idx]
             if c == '\n':
                 line_no += 1
 
-            if c in string.whitespace:
+            if c in WHITESPACE:
                 current_idx += 1
                 continue
 
@@ -179,7 +242,7 @@ class Tokenizer:
                 else:
                     break
 
-            if c in string.digits:
+            if c in DIGITS:
                 current_idx += number()
                 continue
 
@@ -188,12 +251,79 @@ class Tokenizer:
                 continue
 
             if (token := ONE_OR_TWO_CHAR_TOKENS.get(c)) is None:
-                with error.handled_error():
-                    raise error.ParseError(line_no, f'Unexpected character: {c}')
+                self.error(line_no, f'Unexpected character: {c}')
                 current_idx += 1
             else:
                 self.add_token(token, c, 'null', line_no)
                 current_idx += len(c)
 
-        self.add_token(TokenType.EOF, '',  'null', -1)
-        return self.tokens
+
+def scan_chunk(chunk):
+    code, line_no = chunk
+    tokenizer = Tokenizer()
+    tokenizer.tokens, tokenizer.errors = [], []
+    tokenizer.scan_source(code, line_no)
+    return pack_tokens(tokenizer.tokens), tokenizer.errors
+
+
+# Tokens are sent back from workers as columns, which pickles several times
+# faster than a list of Token tuples holding enum members.
+def pack_tokens(tokens):
+    return (
+        bytes(TOKEN_TYPE_INDEX[token.type] for token in tokens),
+        [token.lexeme for token in tokens],
+        [token.literal for token in tokens],
+        [token.line for token in tokens],
+    )
+
+
+def unpack_tokens(columns):
+    types, lexemes, literals, lines = columns
+    return list(map(Token, map(TOKEN_TYPES.__getitem__, types), lexemes, literals, lines))
+
+
+def string_spans(code):
+    # (start, end) of every string literal, found the way the scanner would:
+    # quotes inside comments and comment markers inside strings are skipped
+    import re
+
+    pattern = re.compile(STRING_OR_COMMENT)
+    spans = []
+    i = 0
+    while (m := pattern.search(code, i)) is not None:
+        start = m.start()
+        if m.group() == '//':
+            if (i := code.find('\n', start)) < 0:
+                break
+            continue
+        if (end := code.find('"', start + 1)) < 0:
+            spans.append((start, len(code)))
+            break
+        spans.append((start, end + 1))
+        i = end + 1
+    return spans
+
+
+def split_source(code, n_chunks):
+    # Chunks end right after a newline that is not inside a string literal,
+    # so no token, comment or string crosses a boundary. The scanner doesn't
+    # count newlines inside strings, so neither does the line of each chunk.
+    spans = string_spans(code)
+    chunks = []
+    start, line_no = 0, 1
+    k, hidden = 0, 0
+    cut = code.find('\n', len(code) // n_chunks)
+    while cut >= 0:
+        while k < len(spans) and spans[k][1] <= cut:
+            hidden += code.count('\n', *spans[k])
+            k += 1
+        if k < len(spans) and spans[k][0] < cut:
+            cut = code.find('\n', spans[k][1])
+            continue
+        end = cut + 1
+        chunks.append((code[start:end], line_no))
+        line_no += code.count('\n', start, end) - hidden
+        start, hidden = end, 0
+        cut = code.find('\n', start + len(code) // n_chunks)
+    chunks.append((code[start:], line_no))
+    return chunks
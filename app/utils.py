@@ -1,5 +1,7 @@
 import sys
 
+from .strings import is_string
+
 def get_code():
     if len(sys.argv) < 3:
         print("Usage: ./your_program.sh tokenize <filename>", file=sys.stderr)
@@ -15,18 +17,60 @@ def get_code():
     with open(filename) as file:
         return command, file.read()
 
+class Options:
+    max_steps = None
+    timeout = None
+    max_environments = None
+    max_closures = None
+    max_call_depth = None
+    max_array_bytes = None
+    max_tasks = None
+    jobs = 1
+    memstats = False
+    snapshot = None
+    save_snapshot = None
+    file_root = None
+
+def get_options():
+    options = Options()
+    if len(sys.argv) <= 3:
+        return options
+
+    # argparse is only worth importing when there is something to parse
+    import argparse
+    parser = argparse.ArgumentParser(prog='./your_program.sh <command> <filename>')
+    parser.add_argument('--max-steps', type=int)
+    parser.add_argument('--timeout', type=float, help='wall-clock seconds')
+    parser.add_argument('--max-environments', type=int)
+    parser.add_argument('--max-closures', type=int)
+    parser.add_argument('--max-call-depth', type=int)
+    parser.add_argument('--max-array-bytes', type=int)
+    parser.add_argument('--max-tasks', type=int, help='live tasks at once')
+    parser.add_argument('--jobs', type=int, help='processes used to tokenize large files')
+    parser.add_argument('--memstats', action='store_true', help='track allocations and report them on exit')
+    parser.add_argument('--snapshot', metavar='FILE', help='start from the globals saved in FILE')
+    parser.add_argument('--save-snapshot', metavar='FILE', help='save the globals to FILE after running')
+    parser.add_argument('--file-root', metavar='DIR', help='let readFile and writeFile use files under DIR')
+    return parser.parse_args(sys.argv[3:], namespace=options)
+
+def node_repr(node):
+    fields = ', '.join(f'{name}={getattr(node, name)!r}' for name in node.fields)
+    return f'{type(node).__qualname__}({fields})'
+
 def parenthesize(name, *args):
     return f'({name}' + (' ' if args else '') + ' '.join(map(str, args)) + ')'
 
 def to_str(value, preserve_int=False):
+    if type(value) is float:
+        if preserve_int and value.is_integer():
+            return str(int(value))
+        return repr(value)
     if value is None:
         return 'nil'
     if value is True:
         return 'true'
     if value is False:
         return 'false'
-    if preserve_int and isinstance(value, float) and value.is_integer():
-        value = int(value)
     return str(value)
 
 def are_number_operands(left, right):
@@ -35,7 +79,7 @@ def are_number_operands(left, right):
 def either_numbers_or_strings_operands(left, right):
     if isinstance(left, float) and isinstance(right, float):
         return True
-    if isinstance(left, str) and isinstance(right, str):
+    if is_string(left) and is_string(right):
         return True
     return False
 
@@ -0,0 +1,91 @@
+# Startup benchmark: measures the wall time of `python -m app.main` on a
+# tiny program and the import time of the app modules it loads, and exits
+# with status 1 when either goes over its budget.
+#
+#     python3 benchmarks/startup.py [runs]
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Budgets in milliseconds. They are about 1.75x the worst best-of-5 seen
+# over repeated runs on a busy development machine (tokenize imports 9ms,
+# run imports 41ms, run wall time 49ms over a bare interpreter), so that
+# load on the machine doesn't fail the check, while pulling asyncio (about
+# 50ms) back into startup still does. Smaller regressions need a look at
+# the printed numbers.
+IMPORT_BUDGETS = {
+    'tokenize': 16,
+    'run': 72,
+}
+
+# for the whole process, on top of a bare interpreter
+WALL_BUDGET = 86
+
+PROGRAM = 'var a = "hello";\nprint a + " world";\n'
+
+
+def run(args):
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+
+
+def wall_time(args, runs):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        run(args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def import_time(command, path, runs):
+    # -X importtime reports cumulative microseconds per top-level import
+    best = float('inf')
+    for _ in range(runs):
+        result = run(['-X', 'importtime', '-m', 'app.main', command, path])
+        total = 0
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            # nested imports are indented below the one that loaded them
+            name = name.rstrip()[1:]
+            if name.startswith('app') and not name.startswith(' '):
+                total += int(cumulative)
+        best = min(best, total)
+    return best / 1000
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    with tempfile.NamedTemporaryFile('w', suffix='.lox', delete=False) as file:
+        file.write(PROGRAM)
+    try:
+        baseline = wall_time(['-c', 'pass'], runs)
+        failed = False
+        for command, budget in IMPORT_BUDGETS.items():
+            imports = import_time(command, file.name, runs)
+            wall = wall_time(['-m', 'app.main', command, file.name], runs) - baseline
+            print(f"{command:<10} imports {imports:6.1f}ms (budget {budget}ms)"
+                  f"  wall {wall:6.1f}ms (budget {WALL_BUDGET}ms)")
+            if imports > budget or wall > WALL_BUDGET:
+                failed = True
+    finally:
+        os.unlink(file.name)
+
+    if failed:
+        print("Startup budget exceeded.")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()